@@ -4,6 +4,7 @@ import zipfile
 from utils.parse_mat import parse_mat_file
 from utils.parse_txt import parse_txt_file
 from utils.database import initialize_database, insert_data, populate_processed_data
+from utils.partitions import initialize_catalog, register_experiment, drop_experiment
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -17,7 +18,15 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # Initialize the database
 DB_PATH = './data/measurement_data.db'
 os.makedirs('./data', exist_ok=True)  # Ensure data directory exists
-initialize_database(DB_PATH)
+
+# Partitioned storage: one database per experiment plus a small catalog
+PARTITIONED_STORAGE = os.environ.get('PARTITIONED_STORAGE', '0') == '1'
+CATALOG_PATH = './data/catalog.db'
+
+if PARTITIONED_STORAGE:
+    initialize_catalog(CATALOG_PATH)
+else:
+    initialize_database(DB_PATH)
 
 
 @app.route('/')
@@ -81,6 +90,10 @@ def upload_folder():
         # Debugging: Log file pairs
         print(f"File pairs: {mat_txt_pairs}")
 
+        # In partitioned mode the experiment is registered once its first file has parsed
+        db_path = None if PARTITIONED_STORAGE else DB_PATH
+        created_partition = False
+
         # Process each .mat and .txt pair
         for mat_path, txt_path in mat_txt_pairs:
             try:
@@ -92,15 +105,22 @@ def upload_folder():
                 #print(mat_data['cycles'][0]['current_measurements'])
                 timepoints = parse_txt_file(txt_path)
                 print(timepoints)
-                insert_data(DB_PATH, mat_data, timepoints, experiment_name, channel_name)
+                if db_path is None:
+                    db_path, created_partition = register_experiment(CATALOG_PATH, experiment_name)
+                insert_data(db_path, mat_data, timepoints, experiment_name, channel_name)
             except Exception as e:
+                # Do not leave a partition behind for an upload that failed
+                if created_partition:
+                    drop_experiment(CATALOG_PATH, experiment_name)
                 return jsonify({"error": f"Error processing files {mat_path} and {txt_path}: {e}"}), 500
 
         # Populate the ProcessedData table
         try:
-            populate_processed_data(DB_PATH)
+            populate_processed_data(db_path)
             print("ProcessedData table populated successfully.")
         except Exception as e:
+            if created_partition:
+                drop_experiment(CATALOG_PATH, experiment_name)
             return jsonify({"error": f"Error populating processed data: {e}"}), 500
 
         # Final success response
@@ -110,6 +130,20 @@ def upload_folder():
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
 
 
+@app.route('/experiments/<experiment_name>', methods=['DELETE'])
+def delete_experiment(experiment_name):
+    """Drops an experiment by deleting its partition file."""
+    if not PARTITIONED_STORAGE:
+        return jsonify({"error": "Dropping experiments requires partitioned storage"}), 400
+
+    try:
+        if not drop_experiment(CATALOG_PATH, experiment_name):
+            return jsonify({"error": f"Experiment not found: {experiment_name}"}), 404
+    except Exception as e:
+        return jsonify({"error": f"Error dropping experiment {experiment_name}: {e}"}), 500
+
+    return jsonify({"message": f"Experiment {experiment_name} dropped successfully!"}), 200
+
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -2,38 +2,79 @@ import dash
 from dash import dcc, html, Input, Output
 import pandas as pd
 import sqlite3
+import os
+import sys
+
+# Make the shared utils package importable when running from dash_app/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.database import initialize_database
+from utils.partitions import initialize_catalog, query_partitions
+from utils.anomaly import drop_flagged_cycles
 
 # Database path
 DB_PATH = '../data/measurement_data.db'
 
+# Partitioned storage: one database per experiment plus a small catalog
+PARTITIONED_STORAGE = os.environ.get('PARTITIONED_STORAGE', '0') == '1'
+CATALOG_PATH = '../data/catalog.db'
+
 # Initialize the Dash app
 app = dash.Dash(__name__)
 
+# Columns shown by the dashboard
+PROCESSED_COLUMNS = [
+    'experiment_name', 'channel_name', 'cycle_index', 'timepoint', 'frequency',
+    'imp_2wire', 'imp_4wire', 'phase_2wire', 'phase_4wire',
+    'current_x', 'current_y', 'voltage_r',
+]
+ANNOTATION_COLUMNS = [
+    'experiment_name', 'channel_name', 'cycle_index', 'frequency', 'kind', 'metric', 'value', 'score',
+]
+
 # Function to load processed data from the database
 def load_processed_data():
+    # Aged data is only kept as rollups, shown at the first cycle of each bucket
+    rollup_columns = ['first_cycle AS cycle_index' if c == 'cycle_index' else c for c in PROCESSED_COLUMNS]
+    query = f"""
+    SELECT {', '.join(PROCESSED_COLUMNS)}
+    FROM {{schema}}.ProcessedData
+    UNION ALL
+    SELECT {', '.join(rollup_columns)}
+    FROM {{schema}}.ProcessedDataRollup
+    """
+    if PARTITIONED_STORAGE:
+        df = query_partitions(CATALOG_PATH, query)
+        return df.reindex(columns=PROCESSED_COLUMNS)
+
     conn = sqlite3.connect(DB_PATH)
-    query = """
-    SELECT
-        experiment_name,
-        channel_name,
-        cycle_index,
-        timepoint,
-        frequency,
-        imp_2wire,
-        imp_4wire,
-        phase_2wire,
-        phase_4wire,
-        current_x,
-        current_y,
-        voltage_r
-    FROM ProcessedData
+    df = pd.read_sql_query(query.format(schema='main'), conn)
+    conn.close()
+    return df
+
+# Function to load anomaly annotations from the database
+def load_annotations():
+    query = f"""
+    SELECT {', '.join(ANNOTATION_COLUMNS)}
+    FROM {{schema}}.Annotations
     """
-    df = pd.read_sql_query(query, conn)
+    if PARTITIONED_STORAGE:
+        df = query_partitions(CATALOG_PATH, query)
+        return df.reindex(columns=ANNOTATION_COLUMNS)
+
+    conn = sqlite3.connect(DB_PATH)
+    df = pd.read_sql_query(query.format(schema='main'), conn)
     conn.close()
     return df
 
+# Bring the schema up to date so tables added since the data was ingested exist
+if PARTITIONED_STORAGE:
+    initialize_catalog(CATALOG_PATH)
+else:
+    initialize_database(DB_PATH)
+
 # Load data initially
 data = load_processed_data()
+annotations = load_annotations()
 
 # Unique dropdown options
 experiment_options = [{"label": exp, "value": exp} for exp in data['experiment_name'].unique()]
@@ -75,6 +116,16 @@ app.layout = html.Div([
                 multi=False
             ),
         ], style={"width": "30%", "display": "inline-block"}),
+
+        dcc.Checklist(
+            id="flag-options",
+            options=[
+                {"label": "Overlay anomaly flags", "value": "overlay"},
+                {"label": "Hide flagged cycles", "value": "exclude"},
+            ],
+            value=["overlay"],
+            inline=True,
+        ),
     ], style={"marginBottom": "20px"}),
 
     # Graphs
@@ -90,18 +141,26 @@ app.layout = html.Div([
      Output("phase-graph", "figure")],
     [Input("experiment-filter", "value"),
      Input("channel-filter", "value"),
-     Input("frequency-filter", "value")]
+     Input("frequency-filter", "value"),
+     Input("flag-options", "value")]
 )
-def update_graphs(experiment_name, channel_name, frequency):
+def update_graphs(experiment_name, channel_name, frequency, flag_options):
     filtered_data = data
+    filtered_flags = annotations
+    flag_options = flag_options or []
 
     # Apply filters
     if experiment_name:
         filtered_data = filtered_data[filtered_data['experiment_name'] == experiment_name]
+        filtered_flags = filtered_flags[filtered_flags['experiment_name'] == experiment_name]
     if channel_name:
         filtered_data = filtered_data[filtered_data['channel_name'] == channel_name]
+        filtered_flags = filtered_flags[filtered_flags['channel_name'] == channel_name]
     if frequency:
         filtered_data = filtered_data[filtered_data['frequency'] == frequency]
+        filtered_flags = filtered_flags[filtered_flags['frequency'] == frequency]
+    if "exclude" in flag_options:
+        filtered_data = drop_flagged_cycles(filtered_data, annotations)
 
     # Impedance graph
     impedance_fig = {
@@ -112,6 +171,13 @@ def update_graphs(experiment_name, channel_name, frequency):
         "layout": {"title": "Impedance Over Cycles", "xaxis": {"title": "Cycle Index"}, "yaxis": {"title": "Impedance (Ohms)"}},
     }
 
+    # Mark flagged 4-wire impedance values
+    if "overlay" in flag_options and not filtered_flags.empty:
+        impedance_fig["data"].append({
+            "x": filtered_flags["cycle_index"], "y": filtered_flags["value"], "type": "scatter", "mode": "markers",
+            "name": "Anomaly Flags", "text": filtered_flags["kind"], "marker": {"color": "red", "symbol": "x", "size": 10},
+        })
+
     # Phase graph
     phase_fig = {
         "data": [
@@ -0,0 +1,32 @@
+import numpy as np
+
+from utils.database import insert_data
+
+FREQUENCIES = [10.0, 100.0, 1000.0]
+
+MEASUREMENT_FIELDS = [
+    'x', 'y', 'phase', 'r', 'auxin0', 'auxin0pwr', 'auxin0stddev', 'auxin1', 'auxin1pwr', 'auxin1stddev',
+    'bandwidth', 'frequencypwr', 'frequencystddev', 'grid', 'rpwr', 'rstddev', 'settling', 'tc', 'tcmeas',
+    'xpwr', 'xstddev', 'ypwr', 'ystddev', 'count', 'nexttimestamp', 'settimestamp',
+]
+
+
+def make_mat_data(total_cycles, seed=0):
+    """Builds parsed .mat data in the shape returned by parse_mat_file."""
+    rng = np.random.default_rng(seed)
+    cycles = []
+    for _ in range(total_cycles):
+        cycle = {}
+        for key in ('current_measurements', 'voltage_measurements'):
+            cycle[key] = [
+                {field: float(rng.random()) + 0.1 for field in MEASUREMENT_FIELDS}
+                for _ in FREQUENCIES
+            ]
+        cycles.append(cycle)
+    return {'frequencies': FREQUENCIES, 'total_cycles': total_cycles, 'cycles': cycles}
+
+
+def ingest_channel(db_path, experiment_name, channel_name, total_cycles=12, seed=0):
+    """Inserts one synthetic channel with timepoints 0.5 h apart."""
+    timepoints = [str(i * 0.5) for i in range(total_cycles)]
+    insert_data(db_path, make_mat_data(total_cycles, seed), timepoints, experiment_name, channel_name)
@@ -0,0 +1,94 @@
+import sqlite3
+
+import numpy as np
+
+from utils.anomaly import WINDOW_SIZE, new_series_state, update_series, load_series_states, save_series_states
+from utils.database import initialize_database
+
+
+def noisy_series(length, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 + rng.standard_normal(length)
+
+
+def run_detector(values, state=None):
+    """Feeds values through one series and returns its flags as (index, kind) pairs."""
+    state = state or new_series_state()
+    flags = []
+    for i, value in enumerate(values):
+        flags += [(i, kind) for kind, _ in update_series(state, value)]
+    return flags
+
+
+def kinds(flags, kind):
+    return [i for i, k in flags if k == kind]
+
+
+def test_pure_noise_raises_no_flags():
+    for seed in range(200):
+        assert run_detector(noisy_series(300, seed)) == [], f"seed {seed}"
+
+
+def test_no_flags_before_the_window_is_full():
+    values = noisy_series(200)
+    values[WINDOW_SIZE - 1] += 20
+
+    assert run_detector(values) == []
+
+
+def test_spike_raises_one_outlier():
+    values = noisy_series(200)
+    values[60] += 20
+
+    flags = run_detector(values)
+
+    assert flags == [(60, 'outlier')]
+
+
+def test_step_change_is_flagged_at_the_step():
+    values = noisy_series(300)
+    values[100:] += 10
+
+    flags = run_detector(values)
+
+    assert flags[0] == (100, 'outlier')
+    assert len(kinds(flags, 'drift')) == 1
+    assert kinds(flags, 'drift')[0] >= 100
+
+
+def test_steady_drift_raises_exactly_one_drift():
+    values = noisy_series(300) + np.r_[np.zeros(50), np.linspace(0, 20, 250)]
+
+    flags = run_detector(values)
+
+    assert len(kinds(flags, 'drift')) == 1
+    assert kinds(flags, 'drift')[0] > 50
+
+
+def test_tiny_change_in_flat_series_is_not_flagged():
+    values = np.full(100, 100.0)
+    values[60] *= 1 + 1e-5
+
+    assert run_detector(values) == []
+
+
+def test_state_round_trips_through_database(tmp_path):
+    db_path = tmp_path / "detector.db"
+    initialize_database(str(db_path))
+    values = noisy_series(300) + np.r_[np.zeros(150), np.full(150, 10.0)]
+    values[60] += 20
+
+    expected = run_detector(values)
+
+    # Same series, with the state stored and reloaded after every value
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    flags = []
+    for i, value in enumerate(values):
+        states = load_series_states(cursor, 'exp', 'ch1')
+        state = states.setdefault(1000.0, new_series_state())
+        flags += [(i, kind) for kind, _ in update_series(state, value)]
+        save_series_states(cursor, 'exp', 'ch1', states)
+    conn.close()
+
+    assert flags == expected
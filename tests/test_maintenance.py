@@ -0,0 +1,147 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+from utils import maintenance
+from utils.database import initialize_database, populate_processed_data
+from utils.maintenance import (
+    archive_raw_measurements, rollup_processed_data, restore_archive, compact_database,
+    run_maintenance, set_retention_policy,
+)
+from tests.helpers import ingest_channel
+
+LATER = datetime.now() + timedelta(days=2)
+
+TABLES = {
+    'CurrentMeasurements': 'measurement_id',
+    'VoltageMeasurements': 'measurement_id',
+    'ProcessedData': 'processed_id',
+}
+
+
+def make_database(tmp_path, channel_names=("01",), process=True):
+    db_path = str(tmp_path / "measurement_data.db")
+    initialize_database(db_path)
+    for seed, channel_name in enumerate(channel_names):
+        ingest_channel(db_path, "exp", channel_name, seed=seed)
+    if process:
+        populate_processed_data(db_path)
+    return db_path
+
+
+def snapshot(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = {
+        table: conn.execute(f"SELECT * FROM {table} ORDER BY {key};").fetchall()
+        for table, key in TABLES.items()
+    }
+    conn.close()
+    return rows
+
+
+def count(db_path, table):
+    conn = sqlite3.connect(db_path)
+    total = conn.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+    conn.close()
+    return total
+
+
+def test_archive_and_restore_round_trip(tmp_path):
+    # A numeric-looking channel name must come back as the same TEXT value
+    db_path = make_database(tmp_path, channel_names=("01",))
+    before = snapshot(db_path)
+    set_retention_policy(db_path, "*", raw_retention_days=1, rollup_after_days=1, rollup_cycle_step=5)
+
+    summary = run_maintenance(db_path, str(tmp_path / "archive"), now=LATER)
+
+    assert summary['archived_rows'] == 2 * 12 * 3
+    assert summary['rolled_up_rows'] == 12 * 3
+    assert all(count(db_path, table) == 0 for table in TABLES)
+
+    restored = restore_archive(db_path, "exp")
+
+    assert restored == 3 * 12 * 3
+    assert snapshot(db_path) == before
+    assert count(db_path, 'ProcessedDataRollup') == 0
+    assert count(db_path, 'ArchivedData') == 0
+    assert not list((tmp_path / "archive" / "exp").iterdir())
+
+
+def test_unprocessed_channels_keep_raw_data(tmp_path):
+    db_path = make_database(tmp_path, channel_names=("c",), process=False)
+
+    assert archive_raw_measurements(db_path, str(tmp_path / "archive"), "exp", 1, now=LATER) == 0
+    assert count(db_path, 'CurrentMeasurements') == 12 * 3
+
+    # Processing still works for the old channel and a newly ingested one
+    ingest_channel(db_path, "exp", "c2", seed=1)
+    populate_processed_data(db_path)
+    assert count(db_path, 'ProcessedData') == 2 * 12 * 3
+
+
+def test_processing_skips_cycles_without_measurements(tmp_path):
+    db_path = make_database(tmp_path, channel_names=("c",), process=False)
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM CurrentMeasurements WHERE cycle_index > 6;")
+    conn.commit()
+    conn.close()
+
+    populate_processed_data(db_path)
+
+    assert count(db_path, 'ProcessedData') == 6 * 3
+
+
+def test_rollup_buckets_exclude_flagged_cycles(tmp_path):
+    db_path = make_database(tmp_path, channel_names=("ch1",))
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM Annotations;")
+    conn.execute("""
+    INSERT INTO Annotations (experiment_name, channel_name, cycle_index, frequency, kind)
+    VALUES ('exp', 'ch1', 3, 10.0, 'outlier');
+    """)
+    conn.commit()
+    conn.close()
+
+    rolled_up = rollup_processed_data(db_path, str(tmp_path / "archive"), "exp", 1, 5,
+                                      now=LATER, exclude_flagged=True)
+
+    assert rolled_up == 12 * 3
+    conn = sqlite3.connect(db_path)
+    buckets = conn.execute("""
+    SELECT first_cycle, last_cycle, sample_count FROM ProcessedDataRollup
+    WHERE frequency = 100.0 ORDER BY first_cycle;
+    """).fetchall()
+    conn.close()
+    # The flagged cycle is left out at every frequency, not only the flagged one
+    assert buckets == [(1, 5, 4), (6, 10, 5), (11, 12, 2)]
+
+
+def test_compaction_converts_to_incremental_vacuum(tmp_path):
+    db_path = str(tmp_path / "plain.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE t (x);")
+    conn.executemany("INSERT INTO t VALUES (?);", [(b"x" * 1000,) for _ in range(200)])
+    conn.commit()
+    conn.close()
+
+    assert compact_database(db_path) >= 0
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2
+    conn.execute("DELETE FROM t;")
+    conn.commit()
+    conn.close()
+    assert compact_database(db_path) > 0
+
+
+def test_busy_database_is_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(maintenance, 'BUSY_TIMEOUT', 0.1)
+    db_path = make_database(tmp_path)
+    lock = sqlite3.connect(db_path, isolation_level=None)
+    lock.execute("BEGIN IMMEDIATE;")
+    lock.execute("INSERT INTO Frequencies (frequency) VALUES (1.0);")
+
+    try:
+        assert compact_database(db_path) is None
+    finally:
+        lock.execute("ROLLBACK;")
+        lock.close()
@@ -0,0 +1,98 @@
+import os
+import sqlite3
+
+from utils.database import populate_processed_data
+from utils.partitions import (
+    initialize_catalog, register_experiment, get_partition_paths, drop_experiment, query_partitions,
+)
+from tests.helpers import ingest_channel
+
+
+def test_partition_file_names_are_safe_and_unique(tmp_path):
+    catalog_path = str(tmp_path / "catalog.db")
+    initialize_catalog(catalog_path)
+
+    path, created = register_experiment(catalog_path, "exp B/2")
+    again, created_again = register_experiment(catalog_path, "exp B/2")
+
+    assert os.path.basename(path) == "exp_B_2.db"
+    assert created and not created_again
+    assert again == path
+
+
+def test_partition_file_names_differ_only_in_case(tmp_path):
+    catalog_path = str(tmp_path / "catalog.db")
+    initialize_catalog(catalog_path)
+
+    upper, _ = register_experiment(catalog_path, "Exp")
+    lower, _ = register_experiment(catalog_path, "exp")
+
+    assert os.path.basename(upper).lower() != os.path.basename(lower).lower()
+
+
+def test_query_partitions_with_order_by_and_limit(tmp_path):
+    catalog_path = str(tmp_path / "catalog.db")
+    initialize_catalog(catalog_path)
+    for experiment_name in ("expA", "expB"):
+        path, _ = register_experiment(catalog_path, experiment_name)
+        ingest_channel(path, experiment_name, "ch1")
+        populate_processed_data(path, detect_anomalies=False)
+
+    df = query_partitions(
+        catalog_path,
+        "SELECT experiment_name, cycle_index FROM {schema}.ProcessedData "
+        "WHERE frequency = ? ORDER BY cycle_index DESC LIMIT 1;",
+        params=(100.0,),
+    )
+
+    # ORDER BY/LIMIT apply per partition: one row from each experiment
+    assert sorted(df['experiment_name']) == ["expA", "expB"]
+    assert list(df['cycle_index']) == [12, 12]
+
+
+def test_query_partitions_only_attaches_requested_experiments(tmp_path):
+    catalog_path = str(tmp_path / "catalog.db")
+    initialize_catalog(catalog_path)
+    for experiment_name in ("expA", "expB"):
+        path, _ = register_experiment(catalog_path, experiment_name)
+        ingest_channel(path, experiment_name, "ch1")
+
+    df = query_partitions(catalog_path, "SELECT DISTINCT experiment_name FROM {schema}.Channels",
+                          experiment_names=["expB"])
+
+    assert list(df['experiment_name']) == ["expB"]
+
+
+def test_drop_experiment_removes_partition_archives_and_policy(tmp_path):
+    catalog_path = str(tmp_path / "catalog.db")
+    initialize_catalog(catalog_path)
+    kept_path, _ = register_experiment(catalog_path, "kept")
+    dropped_path, _ = register_experiment(catalog_path, "dropped")
+
+    archive_dir = tmp_path / "archive" / "dropped"
+    archive_dir.mkdir(parents=True)
+    archive_file = archive_dir / "CurrentMeasurements-ch1.csv.gz"
+    archive_file.write_bytes(b"")
+    conn = sqlite3.connect(dropped_path)
+    conn.execute("INSERT INTO ArchivedData (experiment_name, file_path) VALUES (?, ?);",
+                 ("dropped", str(archive_file)))
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect(catalog_path)
+    conn.execute("CREATE TABLE RetentionPolicies (experiment_name TEXT PRIMARY KEY);")
+    conn.execute("INSERT INTO RetentionPolicies VALUES ('dropped'), ('kept');")
+    conn.commit()
+    conn.close()
+
+    assert drop_experiment(catalog_path, "dropped")
+    assert not drop_experiment(catalog_path, "dropped")
+
+    assert not os.path.exists(dropped_path)
+    assert not os.path.exists(f"{dropped_path}-wal")
+    assert not archive_dir.exists()
+    assert os.path.exists(kept_path)
+    assert list(get_partition_paths(catalog_path)) == ["kept"]
+    conn = sqlite3.connect(catalog_path)
+    assert conn.execute("SELECT experiment_name FROM RetentionPolicies;").fetchall() == [("kept",)]
+    conn.close()
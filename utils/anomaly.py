@@ -0,0 +1,122 @@
+import json
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+# Detector settings
+WINDOW_SIZE = 25            # Recent values used for the rolling median/MAD
+OUTLIER_THRESHOLD = 6.0     # Robust z-score above which a single value is flagged
+SCALE_ALPHA = 0.05          # EWMA smoothing the robust sigma used for outliers
+FAST_ALPHA = 0.3            # EWMA tracking the current level
+SLOW_ALPHA = 0.02           # EWMA tracking the long-term baseline
+DRIFT_THRESHOLD = 4.0       # Fast/slow EWMA gap, in robust sigmas, that marks drift
+DRIFT_EXIT_THRESHOLD = 2.0  # Gap below which a drift is over (hysteresis)
+MIN_RELATIVE_SIGMA = 1e-3   # Sigma floor relative to the median, for near-flat series
+
+# Scales the MAD to a standard deviation for normally distributed data
+MAD_TO_SIGMA = 1.4826
+
+
+def new_series_state():
+    """Returns the detector state of a series that has not seen any values."""
+    return {'count': 0, 'window': [], 'fast': None, 'slow': None, 'scale': None, 'drift_sigma': None}
+
+
+def update_series(state, value):
+    """
+    Feeds one value into a series' detector state (updated in place) and returns
+    the flags it raises as a list of (kind, score) tuples. The state is bounded
+    by WINDOW_SIZE, so the cost per value does not grow with the series length.
+    """
+    flags = []
+    if value is None or not np.isfinite(value):
+        return flags
+    value = float(value)
+
+    window = deque(state['window'], maxlen=WINDOW_SIZE)
+    level = None
+    # Nothing is scored until the window is full; median/MAD of a few values is unstable
+    if state['count'] >= WINDOW_SIZE:
+        median = float(np.median(window))
+        mad = float(np.median(np.abs(np.asarray(window) - median)))
+        sigma = max(MAD_TO_SIGMA * mad, MIN_RELATIVE_SIGMA * abs(median), float(np.finfo(float).tiny))
+        if state['fast'] is None:
+            # The EWMAs start from the window median, so warm-up spikes cannot skew them
+            state['fast'] = state['slow'] = median
+
+        # A window of WINDOW_SIZE values now and then underestimates sigma; the
+        # smoothed sigma keeps those dips from turning plain noise into outliers
+        scale = state.get('scale') or sigma
+        score = abs(value - median) / max(sigma, scale)
+        if score > OUTLIER_THRESHOLD:
+            flags.append(('outlier', score))
+        state['scale'] = scale + SCALE_ALPHA * (sigma - scale)
+
+        gap = abs(state['fast'] - state['slow'])
+        if state.get('drift_sigma') is None:
+            drift_score = gap / sigma
+            if drift_score > DRIFT_THRESHOLD:
+                flags.append(('drift', drift_score))
+                state['drift_sigma'] = sigma
+        # Only the onset is flagged. The drift ends once the gap falls well below the
+        # entry threshold, measured against the smaller of the sigma frozen at onset
+        # and the current one, since the window's sigma widens while the level moves
+        elif gap / min(state['drift_sigma'], sigma) < DRIFT_EXIT_THRESHOLD:
+            # The settled level becomes the new baseline, so the tail of the same
+            # shift is not flagged again
+            state['drift_sigma'] = None
+            state['slow'] = state['fast']
+
+        # Clip what the EWMAs see so a single spike does not read as drift
+        level = min(max(value, median - OUTLIER_THRESHOLD * sigma), median + OUTLIER_THRESHOLD * sigma)
+
+    window.append(value)
+    state['window'] = list(window)
+    state['count'] += 1
+    if level is not None:
+        state['fast'] += FAST_ALPHA * (level - state['fast'])
+        state['slow'] += SLOW_ALPHA * (level - state['slow'])
+    return flags
+
+
+def load_series_states(cursor, experiment_name, channel_name):
+    """Returns the stored detector states of a channel as {frequency: state}."""
+    rows = cursor.execute("""
+    SELECT frequency, state FROM DetectorState
+    WHERE experiment_name = ? AND channel_name = ?;
+    """, (experiment_name, channel_name)).fetchall()
+    return {frequency: json.loads(state) for frequency, state in rows}
+
+
+def save_series_states(cursor, experiment_name, channel_name, states):
+    """Stores the detector states of a channel."""
+    cursor.executemany("""
+    INSERT OR REPLACE INTO DetectorState (experiment_name, channel_name, frequency, state)
+    VALUES (?, ?, ?, ?);
+    """, [
+        (experiment_name, channel_name, float(frequency), json.dumps(state))
+        for frequency, state in states.items()
+    ])
+
+
+def annotate(cursor, experiment_name, channel_name, cycle_index, frequency, metric, value, flags):
+    """Inserts one Annotations row per flag raised for a value."""
+    created_at = datetime.now().isoformat(timespec='seconds')
+    cursor.executemany("""
+    INSERT INTO Annotations (
+        experiment_name, channel_name, cycle_index, frequency, kind, metric, value, score, created_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+    """, [
+        (experiment_name, channel_name, int(cycle_index), float(frequency), kind, metric,
+         float(value), float(score), created_at)
+        for kind, score in flags
+    ])
+
+
+def drop_flagged_cycles(df, annotations):
+    """Removes the rows of `df` whose cycle carries any annotation."""
+    flagged = annotations[['experiment_name', 'channel_name', 'cycle_index']].drop_duplicates()
+    merged = df.merge(flagged, on=['experiment_name', 'channel_name', 'cycle_index'],
+                      how='left', indicator=True)
+    return merged[merged['_merge'] == 'left_only'].drop(columns='_merge')
@@ -1,12 +1,27 @@
 import sqlite3
+from datetime import datetime
 import pandas as pd
 import numpy as np
 
+from utils.anomaly import new_series_state, update_series, load_series_states, save_series_states, annotate
+
+def _ensure_column(cursor, table, column, definition):
+    """Adds a column to an existing table if it is missing. Returns True if added."""
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table});")]
+    if column in columns:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+    return True
+
+
 def initialize_database(db_path):
     """Creates the database schema."""
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
+    # Lets maintenance reclaim free pages without a full VACUUM (new databases only)
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+
     # Create Channels table
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS Channels (
@@ -14,7 +29,9 @@ def initialize_database(db_path):
         experiment_name TEXT,
         channel_name TEXT,
         file_name TEXT UNIQUE,
-        total_cycles INTEGER
+        total_cycles INTEGER,
+        ingested_at TEXT,
+        processed_at TEXT
     );
     """)
 
@@ -139,6 +156,92 @@ def initialize_database(db_path):
     );
     """)
 
+    # Create ProcessedDataRollup table (lower-resolution copy of aged ProcessedData)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ProcessedDataRollup (
+        rollup_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel_name TEXT,
+        experiment_name TEXT,
+        frequency REAL,
+        cycle_step INTEGER,
+        first_cycle INTEGER,
+        last_cycle INTEGER,
+        sample_count INTEGER,
+        timepoint REAL,
+        imp_2wire REAL,
+        imp_4wire REAL,
+        imp_4wire_min REAL,
+        imp_4wire_max REAL,
+        phase_2wire REAL,
+        phase_4wire REAL,
+        current_x REAL,
+        current_y REAL,
+        voltage_r REAL
+    );
+    """)
+
+    # Create ArchivedData table (rows moved out to compressed archive files)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ArchivedData (
+        archive_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        experiment_name TEXT,
+        channel_name TEXT,
+        table_name TEXT,
+        file_path TEXT,
+        row_count INTEGER,
+        archived_at TEXT
+    );
+    """)
+
+    # Create Annotations table (cycles flagged by the streaming anomaly detector)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Annotations (
+        annotation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        experiment_name TEXT,
+        channel_name TEXT,
+        cycle_index INTEGER,
+        frequency REAL,
+        kind TEXT,
+        metric TEXT,
+        value REAL,
+        score REAL,
+        created_at TEXT
+    );
+    """)
+
+    # Create DetectorState table (anomaly detector state per channel and frequency)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS DetectorState (
+        experiment_name TEXT,
+        channel_name TEXT,
+        frequency REAL,
+        state TEXT,
+        PRIMARY KEY (experiment_name, channel_name, frequency)
+    );
+    """)
+
+    # Migrate databases created before ingest/processing timestamps existed
+    migrated_at = datetime.now().isoformat(timespec='seconds')
+    if _ensure_column(cursor, "Channels", "ingested_at", "TEXT"):
+        # The real ingest time is unknown, so retention counts from the migration
+        cursor.execute("UPDATE Channels SET ingested_at = ?;", (migrated_at,))
+    if _ensure_column(cursor, "Channels", "processed_at", "TEXT"):
+        # Channels that already have processed rows must not be processed again
+        cursor.execute("""
+        UPDATE Channels SET processed_at = ?
+        WHERE EXISTS (
+            SELECT 1 FROM ProcessedData p
+            WHERE p.experiment_name = Channels.experiment_name
+            AND p.channel_name = Channels.channel_name
+        );
+        """, (migrated_at,))
+
+    # Indexes used by processing and maintenance
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_current_channel ON CurrentMeasurements (channel_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_voltage_channel ON VoltageMeasurements (channel_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_channel ON ProcessedData (experiment_name, channel_name);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_annotations_cycle ON Annotations (experiment_name, channel_name, cycle_index);")
+
     conn.commit()
     conn.close()
 
@@ -160,9 +263,10 @@ def insert_data(db_path, mat_data, timepoints, experiment_name, channel_name):
 
     # Insert into Channels table
     cursor.execute("""
-    INSERT OR IGNORE INTO Channels (experiment_name, channel_name, file_name, total_cycles)
-    VALUES (?, ?, ?, ?)
-    """, (experiment_name, channel_name, f"{experiment_name}-{channel_name}", total_cycles))
+    INSERT OR IGNORE INTO Channels (experiment_name, channel_name, file_name, total_cycles, ingested_at)
+    VALUES (?, ?, ?, ?, ?)
+    """, (experiment_name, channel_name, f"{experiment_name}-{channel_name}", total_cycles,
+          datetime.now().isoformat(timespec='seconds')))
     channel_id = cursor.lastrowid or cursor.execute(
         "SELECT channel_id FROM Channels WHERE experiment_name = ? AND channel_name = ?;",
         (experiment_name, channel_name)
@@ -240,9 +344,10 @@ def insert_data(db_path, mat_data, timepoints, experiment_name, channel_name):
 
 
 
-def populate_processed_data(db_path, amplitude=0.2, rtia=1000):
+def populate_processed_data(db_path, amplitude=0.2, rtia=1000, detect_anomalies=True):
     """
     Processes raw data and populates the ProcessedData table.
+    With detect_anomalies, outliers and drift in imp_4wire are recorded in Annotations.
     """
     import numpy as np
     import pandas as pd
@@ -253,8 +358,8 @@ def populate_processed_data(db_path, amplitude=0.2, rtia=1000):
     # Constants
     rad_to_deg = 180 / np.pi
 
-    # Fetch all channels
-    channels_query = "SELECT channel_id, channel_name, experiment_name FROM Channels;"
+    # Fetch channels that have not been processed yet
+    channels_query = "SELECT channel_id, channel_name, experiment_name FROM Channels WHERE processed_at IS NULL;"
     channels = pd.read_sql_query(channels_query, conn)
 
     for _, channel in channels.iterrows():
@@ -281,6 +386,9 @@ def populate_processed_data(db_path, amplitude=0.2, rtia=1000):
         """
         voltage_df = pd.read_sql_query(voltage_query, conn)
 
+        # Detector state per frequency, resumed from earlier runs
+        series_states = load_series_states(cursor, experiment_name, channel_name) if detect_anomalies else {}
+
         # Process each cycle
         for _, cycle in cycles.iterrows():
             cycle_index = cycle['cycle_index']
@@ -290,6 +398,10 @@ def populate_processed_data(db_path, amplitude=0.2, rtia=1000):
             current_cycle = current_df[current_df['cycle_index'] == cycle_index]
             voltage_cycle = voltage_df[voltage_df['cycle_index'] == cycle_index]
 
+            # Cycles whose raw measurements were archived have nothing to process
+            if current_cycle.empty or voltage_cycle.empty:
+                continue
+
             for freq_idx, freq in enumerate(frequencies):
                 # Extract current and voltage data
                 ix = current_cycle.iloc[freq_idx]['x']
@@ -326,6 +438,22 @@ def populate_processed_data(db_path, amplitude=0.2, rtia=1000):
                     ix, iy, voltage_r, phase_voltage_4wire, phase_current
                 ))
 
+                if detect_anomalies:
+                    state = series_states.setdefault(float(freq), new_series_state())
+                    flags = update_series(state, imp_4wire_val)
+                    if flags:
+                        annotate(cursor, experiment_name, channel_name, cycle_index, freq,
+                                 'imp_4wire', imp_4wire_val, flags)
+
+        if detect_anomalies:
+            save_series_states(cursor, experiment_name, channel_name, series_states)
+
+        # Mark the channel as processed so later runs skip it
+        cursor.execute(
+            "UPDATE Channels SET processed_at = ? WHERE channel_id = ?;",
+            (datetime.now().isoformat(timespec='seconds'), int(channel_id))
+        )
+
     conn.commit()
     conn.close()
 
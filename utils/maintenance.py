@@ -0,0 +1,373 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.database import initialize_database
+from utils.partitions import get_partition_paths
+
+# Raw tables moved to archive files once a channel is older than its retention period
+RAW_TABLES = ('CurrentMeasurements', 'VoltageMeasurements')
+
+# Policy row applied to experiments that have no policy of their own
+DEFAULT_POLICY = '*'
+
+# Written for NULL in archive files, so NULL and empty TEXT stay distinct
+ARCHIVE_NULL = r'\N'
+
+# Seconds to wait for a lock held by an ingest before giving up on a database
+BUSY_TIMEOUT = 30
+
+
+def initialize_retention_policies(db_path):
+    """Creates the RetentionPolicies table."""
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS RetentionPolicies (
+        experiment_name TEXT PRIMARY KEY,
+        raw_retention_days REAL,
+        rollup_after_days REAL,
+        rollup_cycle_step INTEGER
+    );
+    """)
+    conn.commit()
+    conn.close()
+
+
+def set_retention_policy(db_path, experiment_name, raw_retention_days=None, rollup_after_days=None,
+                         rollup_cycle_step=10):
+    """
+    Stores the retention policy for an experiment ('*' for the default policy).
+    A period of None disables that step for the experiment.
+    """
+    initialize_retention_policies(db_path)
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+    conn.execute("""
+    INSERT OR REPLACE INTO RetentionPolicies (
+        experiment_name, raw_retention_days, rollup_after_days, rollup_cycle_step
+    ) VALUES (?, ?, ?, ?);
+    """, (experiment_name, raw_retention_days, rollup_after_days, rollup_cycle_step))
+    conn.commit()
+    conn.close()
+
+
+def get_retention_policy(db_path, experiment_name):
+    """Returns the policy for an experiment, falling back to the default policy, or None."""
+    initialize_retention_policies(db_path)
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("""
+    SELECT * FROM RetentionPolicies
+    WHERE experiment_name IN (?, ?)
+    ORDER BY experiment_name = ? DESC
+    LIMIT 1;
+    """, (experiment_name, DEFAULT_POLICY, experiment_name)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def _cutoff(days, now):
+    """Returns the ISO timestamp `days` before `now`."""
+    return (now - timedelta(days=days)).isoformat(timespec='seconds')
+
+
+def _is_busy(error):
+    """Tells whether an OperationalError means another connection holds the lock."""
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+def _safe_name(name):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(name))
+
+
+def _archive_rows(conn, archive_dir, experiment_name, channel_name, table_name, where, params):
+    """
+    Moves the rows of `table_name` matching `where` into a gzip-compressed CSV
+    file and records it in ArchivedData. Returns the number of rows moved.
+    """
+    df = pd.read_sql_query(f"SELECT * FROM {table_name} WHERE {where};", conn, params=params)
+    if df.empty:
+        return 0
+
+    experiment_dir = os.path.join(archive_dir, _safe_name(experiment_name))
+    os.makedirs(experiment_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+    file_path = os.path.join(experiment_dir, f"{table_name}-{_safe_name(channel_name)}-{stamp}.csv.gz")
+
+    # Write the archive completely before any row leaves the database
+    tmp_path = f"{file_path}.tmp"
+    df.to_csv(tmp_path, index=False, compression='gzip', na_rep=ARCHIVE_NULL)
+    os.replace(tmp_path, file_path)
+
+    conn.execute(f"DELETE FROM {table_name} WHERE {where};", params)
+    conn.execute("""
+    INSERT INTO ArchivedData (experiment_name, channel_name, table_name, file_path, row_count, archived_at)
+    VALUES (?, ?, ?, ?, ?, ?);
+    """, (experiment_name, channel_name, table_name, os.path.abspath(file_path), len(df),
+          datetime.now().isoformat(timespec='seconds')))
+    conn.commit()
+    return len(df)
+
+
+def archive_raw_measurements(db_path, archive_dir, experiment_name, older_than_days, now=None):
+    """
+    Moves raw current/voltage measurements of channels ingested more than
+    `older_than_days` ago into archive files. Channels that have not been
+    processed yet keep their raw data. Returns the number of rows moved.
+    """
+    now = now or datetime.now()
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+    channels = conn.execute("""
+    SELECT channel_id, channel_name FROM Channels
+    WHERE experiment_name = ? AND ingested_at < ? AND processed_at IS NOT NULL;
+    """, (experiment_name, _cutoff(older_than_days, now))).fetchall()
+
+    moved = 0
+    for channel_id, channel_name in channels:
+        for table_name in RAW_TABLES:
+            moved += _archive_rows(conn, archive_dir, experiment_name, channel_name, table_name,
+                                   "channel_id = ?", (channel_id,))
+    conn.close()
+    return moved
+
+
+def rollup_processed_data(db_path, archive_dir, experiment_name, older_than_days, cycle_step, now=None,
+                          exclude_flagged=False):
+    """
+    Replaces ProcessedData of channels processed more than `older_than_days` ago
+    with per-frequency averages over every `cycle_step` cycles. The full-resolution
+    rows are kept in archive files. With exclude_flagged, cycles carrying an
+    annotation are left out of the averages. Returns the number of rows rolled up.
+    """
+    now = now or datetime.now()
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+    channels = conn.execute("""
+    SELECT channel_name FROM Channels
+    WHERE experiment_name = ? AND processed_at < ?;
+    """, (experiment_name, _cutoff(older_than_days, now))).fetchall()
+
+    flagged_filter = """
+        AND NOT EXISTS (
+            SELECT 1 FROM Annotations a
+            WHERE a.experiment_name = ProcessedData.experiment_name
+            AND a.channel_name = ProcessedData.channel_name
+            AND a.cycle_index = ProcessedData.cycle_index
+        )""" if exclude_flagged else ""
+
+    rolled_up = 0
+    for (channel_name,) in channels:
+        conn.execute(f"""
+        INSERT INTO ProcessedDataRollup (
+            channel_name, experiment_name, frequency, cycle_step, first_cycle, last_cycle, sample_count,
+            timepoint, imp_2wire, imp_4wire, imp_4wire_min, imp_4wire_max, phase_2wire, phase_4wire,
+            current_x, current_y, voltage_r
+        )
+        SELECT
+            channel_name, experiment_name, frequency, ?, MIN(cycle_index), MAX(cycle_index), COUNT(*),
+            AVG(timepoint), AVG(imp_2wire), AVG(imp_4wire), MIN(imp_4wire), MAX(imp_4wire),
+            AVG(phase_2wire), AVG(phase_4wire), AVG(current_x), AVG(current_y), AVG(voltage_r)
+        FROM ProcessedData
+        WHERE experiment_name = ? AND channel_name = ?{flagged_filter}
+        GROUP BY channel_name, experiment_name, frequency, (cycle_index - 1) / ?;
+        """, (cycle_step, experiment_name, channel_name, cycle_step))
+
+        # Commits the rollup together with the removal of the full-resolution rows
+        rolled_up += _archive_rows(conn, archive_dir, experiment_name, channel_name, "ProcessedData",
+                                   "experiment_name = ? AND channel_name = ?", (experiment_name, channel_name))
+    conn.commit()
+    conn.close()
+    return rolled_up
+
+
+def _read_archive(conn, table_name, file_path):
+    """Reads an archive file with the column types of the table it is restored into."""
+    text_columns = [
+        row[1] for row in conn.execute(f"PRAGMA table_info({table_name});")
+        if row[2].upper() == 'TEXT'
+    ]
+    # TEXT columns stay strings (channel '01' must not become 1); elsewhere an
+    # empty field is NULL too, as in archives written before ARCHIVE_NULL
+    header = pd.read_csv(file_path, nrows=0).columns
+    na_values = {
+        column: [ARCHIVE_NULL] if column in text_columns else [ARCHIVE_NULL, '']
+        for column in header
+    }
+    return pd.read_csv(file_path, dtype={column: str for column in text_columns if column in header},
+                       keep_default_na=False, na_values=na_values, float_precision='round_trip')
+
+
+def restore_archive(db_path, experiment_name, channel_name=None, table_name=None):
+    """
+    Loads archived rows back into the database and deletes their archive files.
+    Restored ProcessedData replaces the rollup of its channel. Rows that still
+    fall under the retention policy are archived again by the next run.
+    Returns the number of rows restored.
+    """
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+    query = "SELECT archive_id, channel_name, table_name, file_path FROM ArchivedData WHERE experiment_name = ?"
+    params = [experiment_name]
+    if channel_name is not None:
+        query += " AND channel_name = ?"
+        params.append(channel_name)
+    if table_name is not None:
+        query += " AND table_name = ?"
+        params.append(table_name)
+    archives = conn.execute(query + " ORDER BY archive_id;", params).fetchall()
+
+    restored = 0
+    for archive_id, archive_channel, archive_table, file_path in archives:
+        df = _read_archive(conn, archive_table, file_path)
+        df.to_sql(archive_table, conn, if_exists='append', index=False)
+
+        if archive_table == 'ProcessedData':
+            conn.execute(
+                "DELETE FROM ProcessedDataRollup WHERE experiment_name = ? AND channel_name = ?;",
+                (experiment_name, archive_channel)
+            )
+        conn.execute("DELETE FROM ArchivedData WHERE archive_id = ?;", (archive_id,))
+        conn.commit()
+        os.remove(file_path)
+        restored += len(df)
+
+    conn.close()
+    return restored
+
+
+def compact_database(db_path):
+    """
+    Returns free pages to the filesystem and refreshes query planner statistics.
+    Databases created without incremental auto-vacuum are converted once with a
+    full VACUUM. Returns the number of bytes reclaimed, or None if the database
+    was busy and compaction was skipped.
+    """
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    try:
+        # Flush the WAL first so the file sizes compare like for like
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        size_before = os.path.getsize(db_path)
+
+        if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+            conn.execute("VACUUM;")
+        else:
+            conn.execute("PRAGMA incremental_vacuum;")
+
+        conn.execute("ANALYZE;")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    except sqlite3.OperationalError as e:
+        if not _is_busy(e):
+            raise
+        return None
+    finally:
+        conn.close()
+
+    # The one-off conversion can grow the file slightly; report that as nothing reclaimed
+    return max(0, size_before - os.path.getsize(db_path))
+
+
+def run_maintenance(db_path, archive_dir, policy_db_path=None, now=None, exclude_flagged=False):
+    """
+    Applies the retention policies to every experiment stored in `db_path`, then
+    compacts it. Policies are read from `policy_db_path` (defaults to `db_path`).
+    Returns a summary dict, which only holds 'skipped' if the database was busy.
+    """
+    now = now or datetime.now()
+    policy_db_path = policy_db_path or db_path
+    try:
+        initialize_database(db_path)
+    except sqlite3.OperationalError as e:
+        if not _is_busy(e):
+            raise
+        return {'skipped': str(e)}
+
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+    experiments = [row[0] for row in conn.execute("SELECT DISTINCT experiment_name FROM Channels;")]
+    conn.close()
+
+    summary = {'archived_rows': 0, 'rolled_up_rows': 0}
+    for experiment_name in experiments:
+        policy = get_retention_policy(policy_db_path, experiment_name)
+        if policy is None:
+            continue
+        if policy['raw_retention_days'] is not None:
+            summary['archived_rows'] += archive_raw_measurements(
+                db_path, archive_dir, experiment_name, policy['raw_retention_days'], now)
+        if policy['rollup_after_days'] is not None:
+            summary['rolled_up_rows'] += rollup_processed_data(
+                db_path, archive_dir, experiment_name, policy['rollup_after_days'],
+                policy['rollup_cycle_step'] or 1, now, exclude_flagged)
+
+    summary['reclaimed_bytes'] = compact_database(db_path)
+    return summary
+
+
+def _resolve_databases(args, experiment_name=None):
+    """Returns the databases the CLI operates on and the database holding the policies."""
+    if args.catalog:
+        names = None if experiment_name is None else [experiment_name]
+        return list(get_partition_paths(args.catalog, names).values()), args.catalog
+    return [args.db], args.db
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retention, rollup and compaction of measurement databases.")
+    parser.add_argument('--db', default='./data/measurement_data.db', help="Single-file database")
+    parser.add_argument('--catalog', help="Catalog database of partitioned storage (overrides --db)")
+    parser.add_argument('--archive-dir', default='./data/archive', help="Directory for archive files")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Apply retention policies and compact")
+    run_parser.add_argument('--every', type=float, help="Repeat every N hours instead of running once")
+    run_parser.add_argument('--exclude-flagged', action='store_true',
+                            help="Leave cycles flagged by the anomaly detector out of rollups")
+
+    policy_parser = subparsers.add_parser('set-policy', help="Set an experiment's retention policy")
+    policy_parser.add_argument('experiment', help=f"Experiment name, or '{DEFAULT_POLICY}' for the default")
+    policy_parser.add_argument('--raw-days', type=float, help="Archive raw measurements after N days")
+    policy_parser.add_argument('--rollup-days', type=float, help="Roll up processed data after N days")
+    policy_parser.add_argument('--rollup-cycles', type=int, default=10, help="Cycles per rollup row")
+
+    restore_parser = subparsers.add_parser('restore', help="Restore archived rows")
+    restore_parser.add_argument('experiment')
+    restore_parser.add_argument('--channel')
+    restore_parser.add_argument('--table', choices=RAW_TABLES + ('ProcessedData',))
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'set-policy':
+        _, policy_db_path = _resolve_databases(args)
+        set_retention_policy(policy_db_path, args.experiment, args.raw_days, args.rollup_days, args.rollup_cycles)
+        print(f"Retention policy set for {args.experiment}")
+
+    elif args.command == 'restore':
+        db_paths, _ = _resolve_databases(args, args.experiment)
+        restored = sum(restore_archive(db_path, args.experiment, args.channel, args.table) for db_path in db_paths)
+        print(f"Restored {restored} rows for {args.experiment}")
+
+    elif args.command == 'run':
+        while True:
+            try:
+                db_paths, policy_db_path = _resolve_databases(args)
+            except sqlite3.OperationalError as e:
+                print(f"Catalog unavailable, retrying on the next run: {e}")
+                db_paths, policy_db_path = [], None
+            for db_path in db_paths:
+                # A database locked by an ingest is skipped until the next run
+                try:
+                    summary = run_maintenance(db_path, args.archive_dir, policy_db_path,
+                                              exclude_flagged=args.exclude_flagged)
+                except sqlite3.OperationalError as e:
+                    print(f"{db_path}: skipped, retrying on the next run: {e}")
+                    continue
+                print(f"{db_path}: {summary}")
+            if not args.every:
+                break
+            time.sleep(args.every * 3600)
+
+
+if __name__ == '__main__':
+    main()
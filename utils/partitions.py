@@ -0,0 +1,203 @@
+import os
+import re
+import sqlite3
+from datetime import datetime
+from urllib.request import pathname2url
+
+import pandas as pd
+
+from utils.database import initialize_database
+
+# Partition files live in this directory next to the catalog database
+PARTITION_SUBDIR = 'experiments'
+
+# SQLite's default SQLITE_MAX_ATTACHED; larger queries are split into batches
+MAX_ATTACHED = 10
+
+
+def initialize_catalog(catalog_path):
+    """Creates the catalog schema and the partition directory, and migrates existing partitions."""
+    os.makedirs(get_partition_dir(catalog_path), exist_ok=True)
+
+    conn = sqlite3.connect(catalog_path)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS Experiments (
+        experiment_name TEXT PRIMARY KEY,
+        file_name TEXT UNIQUE,
+        created_at TEXT
+    );
+    """)
+    conn.commit()
+    conn.close()
+
+    # Bring partitions created by older versions up to the current schema
+    for partition_path in get_partition_paths(catalog_path).values():
+        if os.path.exists(partition_path):
+            initialize_database(partition_path)
+
+
+def get_partition_dir(catalog_path):
+    """Returns the directory holding the per-experiment database files."""
+    return os.path.join(os.path.dirname(os.path.abspath(catalog_path)), PARTITION_SUBDIR)
+
+
+def _partition_file_name(conn, experiment_name):
+    """Builds a unique, filesystem-safe file name for a new experiment partition."""
+    base = re.sub(r'[^A-Za-z0-9_.-]', '_', experiment_name).strip('.') or 'experiment'
+    file_name = f"{base}.db"
+    suffix = 1
+    # Compared case-insensitively: on macOS/Windows "Exp.db" and "exp.db" are the same file
+    while conn.execute(
+        "SELECT 1 FROM Experiments WHERE lower(file_name) = lower(?);", (file_name,)
+    ).fetchone():
+        suffix += 1
+        file_name = f"{base}_{suffix}.db"
+    return file_name
+
+
+def register_experiment(catalog_path, experiment_name):
+    """
+    Returns (partition_path, created) for an experiment, creating and registering
+    the partition in the catalog if it does not exist yet.
+    """
+    conn = sqlite3.connect(catalog_path, timeout=30, isolation_level=None)
+    try:
+        # Take the write lock first so concurrent uploads cannot pick the same name
+        conn.execute("BEGIN IMMEDIATE;")
+        file_name = _partition_file_name(conn, experiment_name)
+        created = conn.execute(
+            "INSERT OR IGNORE INTO Experiments (experiment_name, file_name, created_at) VALUES (?, ?, ?);",
+            (experiment_name, file_name, datetime.now().isoformat(timespec='seconds'))
+        ).rowcount == 1
+        conn.execute("COMMIT;")
+        file_name = conn.execute(
+            "SELECT file_name FROM Experiments WHERE experiment_name = ?;", (experiment_name,)
+        ).fetchone()[0]
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK;")
+        raise
+    finally:
+        conn.close()
+
+    partition_path = os.path.join(get_partition_dir(catalog_path), file_name)
+    initialize_database(partition_path)
+
+    # WAL lets the dashboard keep reading an experiment while it is being ingested
+    conn = sqlite3.connect(partition_path)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.close()
+
+    return partition_path, created
+
+
+def get_partition_paths(catalog_path, experiment_names=None):
+    """
+    Returns a {experiment_name: partition_path} mapping for the requested
+    experiments, or for every registered experiment when none are given.
+    """
+    conn = sqlite3.connect(catalog_path)
+    if experiment_names is None:
+        rows = conn.execute(
+            "SELECT experiment_name, file_name FROM Experiments ORDER BY experiment_name;"
+        ).fetchall()
+    else:
+        experiment_names = list(experiment_names)
+        placeholders = ', '.join('?' for _ in experiment_names)
+        rows = conn.execute(
+            f"SELECT experiment_name, file_name FROM Experiments WHERE experiment_name IN ({placeholders});",
+            experiment_names
+        ).fetchall()
+    conn.close()
+
+    partition_dir = get_partition_dir(catalog_path)
+    return {name: os.path.join(partition_dir, file_name) for name, file_name in rows}
+
+
+def _table_exists(conn, table_name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;", (table_name,)
+    ).fetchone() is not None
+
+
+def drop_experiment(catalog_path, experiment_name):
+    """
+    Removes an experiment from the catalog and deletes its partition file,
+    its archive files and its retention policy.
+    Returns False if the experiment is not registered.
+    """
+    partition_path = get_partition_paths(catalog_path, [experiment_name]).get(experiment_name)
+    if partition_path is None:
+        return False
+
+    # ArchivedData lives in the partition, so collect the archive files before deleting it
+    archive_files = []
+    if os.path.exists(partition_path):
+        conn = sqlite3.connect(partition_path)
+        if _table_exists(conn, 'ArchivedData'):
+            archive_files = [row[0] for row in conn.execute("SELECT file_path FROM ArchivedData;")]
+        conn.close()
+
+    conn = sqlite3.connect(catalog_path)
+    conn.execute("DELETE FROM Experiments WHERE experiment_name = ?;", (experiment_name,))
+    if _table_exists(conn, 'RetentionPolicies'):
+        conn.execute("DELETE FROM RetentionPolicies WHERE experiment_name = ?;", (experiment_name,))
+    conn.commit()
+    conn.close()
+
+    for path in (partition_path, f"{partition_path}-wal", f"{partition_path}-shm", *archive_files):
+        if os.path.exists(path):
+            os.remove(path)
+
+    # Remove the experiment's archive directories once they are empty
+    for archive_dir in {os.path.dirname(path) for path in archive_files}:
+        if os.path.isdir(archive_dir) and not os.listdir(archive_dir):
+            os.rmdir(archive_dir)
+    return True
+
+
+def query_partitions(catalog_path, query, experiment_names=None, params=()):
+    """
+    Runs a query across experiment partitions and returns a single DataFrame.
+
+    `query` is written against one partition, with `{schema}` in place of the
+    schema name, e.g. "SELECT * FROM {schema}.ProcessedData WHERE frequency = ?".
+    Only the partitions of the requested experiments are attached, and the
+    per-partition results are combined with UNION ALL.
+
+    ORDER BY, LIMIT, GROUP BY and aggregates apply to each partition on its own,
+    not to the combined result; aggregate across experiments on the returned
+    DataFrame instead.
+    """
+    partition_paths = [
+        path for path in get_partition_paths(catalog_path, experiment_names).values()
+        if os.path.exists(path)
+    ]
+    query = query.strip().rstrip(';')
+
+    frames = []
+    for start in range(0, len(partition_paths), MAX_ATTACHED):
+        batch = partition_paths[start:start + MAX_ATTACHED]
+        conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(catalog_path))}?mode=ro", uri=True)
+        try:
+            schemas = []
+            for i, path in enumerate(batch):
+                schema = f"p{i}"
+                conn.execute(
+                    f"ATTACH DATABASE ? AS {schema};",
+                    (f"file:{pathname2url(os.path.abspath(path))}?mode=ro",)
+                )
+                schemas.append(schema)
+
+            # Subqueries keep each partition's ORDER BY/LIMIT valid inside the union
+            union_query = "\nUNION ALL\n".join(
+                f"SELECT * FROM ({query.format(schema=schema)})" for schema in schemas
+            )
+            frames.append(pd.read_sql_query(union_query, conn, params=tuple(params) * len(schemas)))
+        finally:
+            conn.close()
+
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)